@@ -1,6 +1,9 @@
 import csv
 import os
 import logging
+import time
+from datetime import timedelta
+from typing import Optional
 from celery import Celery
 from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.orm import Session
@@ -8,7 +11,9 @@ from sqlalchemy.orm import Session
 from .config import get_config
 from .database import SessionLocal
 from .models import Product, Webhook
+from . import scheduler, snapshots
 from .utils import validate_webhook_url
+from .validation import validate_csv
 import requests
 
 logging.basicConfig(
@@ -22,16 +27,39 @@ config = get_config()
 celery = Celery(__name__, broker=config.redis_url, backend=config.redis_url)
 
 celery.conf.broker_transport_options = {'visibility_timeout': 3600}
+celery.conf.task_default_queue = scheduler.DEFAULT_QUEUE
+# Large imports run for minutes; don't let a busy worker reserve small jobs behind one.
+celery.conf.worker_prefetch_multiplier = 1
 
 @celery.task(bind=True, name="process_csv_file")
-def process_csv_file(self, file_path: str):
+def process_csv_file(
+    self,
+    file_path: str,
+    source: str = scheduler.DEFAULT_SOURCE,
+    file_digest: Optional[str] = None,
+    force: bool = False
+):
+    if not scheduler.acquire_slot(self.request.id, source):
+        logger.info(
+            f"Import group '{scheduler.group_for(source)}' is busy. Deferring task {self.request.id}"
+        )
+        raise self.retry(countdown=config.source_retry_delay, max_retries=None)
+
     db: Session = SessionLocal()
     processed_count = 0
+    written_count = 0
     task_success = False
     
     try:
         logger.info(f"Task Started. Processing file: {file_path}")
 
+        start_state = snapshots.current_state()
+        generation = int(start_state.split(":")[0])
+        snapshot_stale = not snapshots.snapshot_is_current(generation)
+        full_import = force or snapshot_stale
+        if snapshot_stale:
+            logger.info("Import snapshot is stale. Writing every row.")
+
         self.update_state(state='PROGRESS', meta={
             'current': 0,
             'total': 0,
@@ -72,8 +100,11 @@ def process_csv_file(self, file_path: str):
                         'status': 'Saving batch to DB...'
                     })
                     
-                    _bulk_upsert(db, batch)
+                    changed = snapshots.filter_changed(self.request.id, batch, full_import)
+                    _bulk_upsert(db, changed)
                     processed_count += len(batch)
+                    written_count += len(changed)
+                    scheduler.refresh_slot(self.request.id, source)
                     
                     self.update_state(
                         state='PROGRESS',
@@ -93,8 +124,10 @@ def process_csv_file(self, file_path: str):
                     'rows_processed': processed_count,
                     'status': 'Saving final batch...'
                 })
-                _bulk_upsert(db, batch)
+                changed = snapshots.filter_changed(self.request.id, batch, full_import)
+                _bulk_upsert(db, changed)
                 processed_count += len(batch)
+                written_count += len(changed)
 
             self.update_state(state='PROGRESS', meta={
                 'current': processed_count,
@@ -102,9 +135,27 @@ def process_csv_file(self, file_path: str):
                 'rows_processed': processed_count,
                 'status': 'Finalizing transaction...'
             })
+            # Bumped before the commit so a cached upload can never outlive
+            # the rows it described. An identical upload is only cached if
+            # no other import wrote in between.
+            record_state = start_state
+            if written_count:
+                generation_part, writes = start_state.split(":")
+                expected_state = f"{generation_part}:{int(writes) + 1}"
+                record_state = expected_state if snapshots.mark_written() == expected_state else None
             db.commit()
             task_success = True
-            logger.info(f"Task Completed. Processed {processed_count} records.")
+            logger.info(
+                f"Task Completed. Processed {processed_count} records, "
+                f"{written_count} new or changed."
+            )
+
+            try:
+                snapshots.commit_snapshot(self.request.id, generation, reset=snapshot_stale)
+                if file_digest and record_state:
+                    snapshots.record_import(source, file_digest, self.request.id, record_state)
+            except Exception as e:
+                logger.warning(f"Failed to update import snapshot: {e}")
 
             try:
                 self.update_state(state='PROGRESS', meta={
@@ -118,6 +169,7 @@ def process_csv_file(self, file_path: str):
                     "event": "import_completed",
                     "file_path": file_path,
                     "processed_count": processed_count,
+                    "written_count": written_count,
                     "status": "success"
                 }
                 for webhook in webhooks:
@@ -133,10 +185,12 @@ def process_csv_file(self, file_path: str):
     except Exception as e:
         logger.error(f"Task Failed: {str(e)}", exc_info=True)
         db.rollback()
+        snapshots.discard_snapshot(self.request.id)
         return {"status": "Failed", "error": str(e)}
     
     finally:
         db.close()
+        scheduler.release_slot(self.request.id, source)
         
         if os.path.exists(file_path):
             self.update_state(state='PROGRESS', meta={
@@ -145,26 +199,108 @@ def process_csv_file(self, file_path: str):
                 'rows_processed': processed_count,
                 'status': 'Cleaning up...'
             })
-            should_delete = False
-            
-            if config.csv_deletion_policy == "always":
-                should_delete = True
-                logger.info(f"Deleting CSV file (policy: always): {file_path}")
-            elif config.csv_deletion_policy == "success" and task_success:
-                should_delete = True
-                logger.info(f"Deleting CSV file (policy: success, task succeeded): {file_path}")
-            elif config.csv_deletion_policy == "never":
-                logger.info(f"Keeping CSV file (policy: never): {file_path}")
-            else:
-                logger.info(f"Keeping CSV file (policy: {config.csv_deletion_policy}, task_success: {task_success}): {file_path}")
-            
-            if should_delete:
-                try:
-                    os.remove(file_path)
-                except Exception as e:
-                    logger.warning(f"Failed to delete CSV file {file_path}: {e}")
+            _apply_deletion_policy(file_path, task_success)
+
+    return {
+        "status": "Completed",
+        "total": processed_count,
+        "written": written_count,
+        "unchanged": processed_count - written_count
+    }
+
+
+@celery.task(bind=True, name="validate_csv_file")
+def validate_csv_file(self, file_path: str):
+    task_success = False
+    report_path = os.path.join(config.report_dir, f"report_{self.request.id}.csv")
+
+    try:
+        logger.info(f"Dry run started. Validating file: {file_path}")
+        os.makedirs(config.report_dir, exist_ok=True)
+        _purge_expired_reports()
+
+        self.update_state(state='PROGRESS', meta={
+            'current': 0,
+            'total': 0,
+            'rows_processed': 0,
+            'status': 'Validating CSV...'
+        })
+
+        def on_progress(rows_checked: int):
+            self.update_state(state='PROGRESS', meta={
+                'current': rows_checked,
+                'total': 0,
+                'rows_processed': rows_checked,
+                'status': 'Validating CSV...'
+            })
+
+        summary = validate_csv(file_path, report_path, on_progress, config.batch_size)
+        task_success = True
+        logger.info(
+            f"Dry run completed. {summary['invalid_rows']} of {summary['total_rows']} rows invalid."
+        )
+
+    except Exception as e:
+        logger.error(f"Dry run Failed: {str(e)}", exc_info=True)
+        return {"status": "Failed", "dry_run": True, "error": str(e)}
+
+    finally:
+        if os.path.exists(file_path):
+            _apply_deletion_policy(file_path, task_success)
+
+    return {
+        "status": "Completed",
+        "dry_run": True,
+        "has_report": summary["error_count"] > 0,
+        **summary
+    }
+
+
+def _purge_expired_reports():
+    """
+    Deletes reports whose task result has expired and can no longer link to
+    them. Best effort: a failure here must never fail the dry run itself.
+    """
+    try:
+        expires = celery.conf.result_expires
+        if isinstance(expires, timedelta):
+            expires = expires.total_seconds()
+        if not expires:
+            return
+
+        cutoff = time.time() - float(expires)
+        for entry in os.scandir(config.report_dir):
+            if not entry.name.startswith("report_") or not entry.is_file():
+                continue
+            try:
+                if entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+                    logger.info(f"Deleted expired validation report: {entry.path}")
+            except OSError as e:
+                logger.warning(f"Failed to delete validation report {entry.path}: {e}")
+    except Exception as e:
+        logger.warning(f"Failed to purge expired validation reports: {e}")
+
+
+def _apply_deletion_policy(file_path: str, task_success: bool):
+    should_delete = False
+
+    if config.csv_deletion_policy == "always":
+        should_delete = True
+        logger.info(f"Deleting CSV file (policy: always): {file_path}")
+    elif config.csv_deletion_policy == "success" and task_success:
+        should_delete = True
+        logger.info(f"Deleting CSV file (policy: success, task succeeded): {file_path}")
+    elif config.csv_deletion_policy == "never":
+        logger.info(f"Keeping CSV file (policy: never): {file_path}")
+    else:
+        logger.info(f"Keeping CSV file (policy: {config.csv_deletion_policy}, task_success: {task_success}): {file_path}")
 
-    return {"status": "Completed", "total": processed_count}
+    if should_delete:
+        try:
+            os.remove(file_path)
+        except Exception as e:
+            logger.warning(f"Failed to delete CSV file {file_path}: {e}")
 
 
 def _bulk_upsert(db: Session, batch_data: list):
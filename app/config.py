@@ -45,6 +45,41 @@ class Config:
         self.db_pool_size = int(os.getenv("DB_POOL_SIZE", "20"))
         self.db_max_overflow = int(os.getenv("DB_MAX_OVERFLOW", "10"))
 
+        try:
+            self.large_file_threshold_mb = int(os.getenv("LARGE_FILE_THRESHOLD_MB", "100"))
+            if self.large_file_threshold_mb <= 0:
+                raise ValueError("LARGE_FILE_THRESHOLD_MB must be a positive integer")
+        except (ValueError, TypeError) as e:
+            raise RuntimeError(f"Invalid LARGE_FILE_THRESHOLD_MB in environment: {e}")
+
+        try:
+            self.group_concurrency_limit = int(os.getenv("GROUP_CONCURRENCY_LIMIT", "1"))
+            if self.group_concurrency_limit <= 0:
+                raise ValueError("GROUP_CONCURRENCY_LIMIT must be a positive integer")
+        except (ValueError, TypeError) as e:
+            raise RuntimeError(f"Invalid GROUP_CONCURRENCY_LIMIT in environment: {e}")
+
+        self.source_groups = {}
+        for entry in os.getenv("SOURCE_GROUPS", "").split(","):
+            if not entry.strip():
+                continue
+            source, sep, group = entry.partition("=")
+            source, group = source.strip().lower(), group.strip().lower()
+            if not sep or not source or not group:
+                raise RuntimeError(
+                    f"Invalid SOURCE_GROUPS entry: {entry!r}. Expected 'source=group'"
+                )
+            self.source_groups[source] = group
+
+        try:
+            self.source_retry_delay = int(os.getenv("SOURCE_RETRY_DELAY", "10"))
+            if self.source_retry_delay <= 0:
+                raise ValueError("SOURCE_RETRY_DELAY must be a positive integer")
+        except (ValueError, TypeError) as e:
+            raise RuntimeError(f"Invalid SOURCE_RETRY_DELAY in environment: {e}")
+
+        self.report_dir = os.getenv("REPORT_DIR", "reports")
+
 
 _config: Optional[Config] = None
 
@@ -2,7 +2,7 @@ from typing import Optional
 import logging
 from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
-from app import models, schemas, database
+from app import models, schemas, database, snapshots
 
 logger = logging.getLogger(__name__)
 
@@ -59,6 +59,7 @@ def update_product(
     for key, value in update_data.items():
         setattr(product, key, value)
     
+    snapshots.invalidate()
     db.commit()
     db.refresh(product)
     return product
@@ -70,6 +71,7 @@ def delete_product(product_id: int, db: Session = Depends(database.get_db)):
         raise HTTPException(status_code=404, detail="Product not found")
     
     db.delete(product)
+    snapshots.invalidate()
     db.commit()
     return {"message": "Product deleted successfully"}
 
@@ -77,6 +79,7 @@ def delete_product(product_id: int, db: Session = Depends(database.get_db)):
 def delete_all_products(db: Session = Depends(database.get_db)):
     try:
         num_deleted = db.query(models.Product).delete()
+        snapshots.invalidate()
         db.commit()
         return {"message": f"Deleted {num_deleted} products"}
     except Exception as e:
@@ -1,20 +1,31 @@
-import shutil
 import os
 import uuid
 import logging
-from fastapi import APIRouter, UploadFile, File, HTTPException, status
+from typing import Optional
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, status
+from fastapi.responses import FileResponse
 from celery.result import AsyncResult
-from app.celery_worker import process_csv_file, celery
+from app import scheduler, snapshots
+from app.config import get_config
+from app.celery_worker import process_csv_file, validate_csv_file, celery
 
 logger = logging.getLogger(__name__)
 
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
 router = APIRouter(
     prefix="/upload",
     tags=["Upload Operations"]
 )
 
 @router.post("/", status_code=status.HTTP_202_ACCEPTED)
-async def upload_file(file: UploadFile = File(...)):
+async def upload_file(
+    file: UploadFile = File(...),
+    source: Optional[str] = Form(None),
+    priority: Optional[str] = Form(None),
+    dry_run: bool = Form(False),
+    force: bool = Form(False)
+):
     if not file.filename.lower().endswith('.csv'):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, 
@@ -24,8 +35,12 @@ async def upload_file(file: UploadFile = File(...)):
     temp_filename = f"temp_{uuid.uuid4()}.csv"
     
     try:
+        hasher = snapshots.new_file_hasher()
         with open(temp_filename, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+            while chunk := file.file.read(UPLOAD_CHUNK_SIZE):
+                hasher.update(chunk)
+                buffer.write(chunk)
+        file_digest = hasher.hexdigest()
             
         if os.path.getsize(temp_filename) == 0:
             os.remove(temp_filename)
@@ -36,14 +51,71 @@ async def upload_file(file: UploadFile = File(...)):
             os.remove(temp_filename)
         raise HTTPException(status_code=500, detail="Could not save file") from e
 
-    task = process_csv_file.delay(temp_filename)
+    try:
+        queue = scheduler.choose_queue(os.path.getsize(temp_filename), priority)
+    except ValueError as e:
+        os.remove(temp_filename)
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if dry_run:
+        task = validate_csv_file.apply_async(args=[temp_filename], queue=queue)
+        return {
+            "message": "File uploaded successfully. Validation started (dry run, no data will be written).",
+            "task_id": task.id,
+            "queue": queue,
+            "dry_run": True
+        }
+
+    source = scheduler.normalize_source(source)
+
+    if not force:
+        try:
+            previous_task_id = snapshots.find_previous_import(source, file_digest)
+            is_duplicate = bool(previous_task_id) and _is_completed_import(previous_task_id)
+        except Exception as e:
+            os.remove(temp_filename)
+            logger.error(f"Failed to look up previous imports: {e}", exc_info=True)
+            raise HTTPException(status_code=503, detail="Could not schedule import. Please try again later.")
+
+        if is_duplicate:
+            os.remove(temp_filename)
+            return {
+                "message": "Identical file was already imported. Returning the previous result.",
+                "task_id": previous_task_id,
+                "duplicate": True
+            }
+
+    task_id = str(uuid.uuid4())
+    try:
+        scheduler.register_job(task_id, queue, source)
+        process_csv_file.apply_async(
+            args=[temp_filename, source],
+            kwargs={"file_digest": file_digest, "force": force},
+            queue=queue,
+            task_id=task_id
+        )
+    except Exception as e:
+        scheduler.unregister_job(task_id, source)
+        os.remove(temp_filename)
+        logger.error(f"Failed to enqueue import task {task_id}: {e}", exc_info=True)
+        raise HTTPException(status_code=503, detail="Could not schedule import. Please try again later.")
 
     return {
         "message": "File uploaded successfully. Processing started.",
-        "task_id": task.id
+        "task_id": task_id,
+        "queue": queue,
+        "source": source
     }
 
 
+def _is_completed_import(task_id: str) -> bool:
+    task_result = AsyncResult(task_id, app=celery)
+    if task_result.state != 'SUCCESS':
+        return False
+    result = task_result.result or {}
+    return result.get("status") == "Completed"
+
+
 @router.get("/{task_id}")
 def get_upload_status(task_id: str):
     task_result = AsyncResult(task_id, app=celery)
@@ -55,7 +127,16 @@ def get_upload_status(task_id: str):
         "details": None
     }
 
-    if task_result.state == 'PROGRESS':
+    if task_result.state in ('PENDING', 'RETRY'):
+        position = scheduler.get_queue_position(task_id)
+        if position:
+            response["status"] = "QUEUED"
+            response["details"] = {
+                **position,
+                "message": f"Queued (position {position['position']} in group {position['group']})"
+            }
+
+    elif task_result.state == 'PROGRESS':
         data = task_result.info
         current = data.get("current", 0)
         total = data.get("total", 1)
@@ -73,6 +154,10 @@ def get_upload_status(task_id: str):
         response["progress_percent"] = 100
         response["status"] = "COMPLETED"
         response["details"] = task_result.result
+
+        result = task_result.result or {}
+        if result.get("dry_run") and result.get("has_report"):
+            response["report_url"] = f"/upload/{task_id}/report"
         
     elif task_result.state == 'FAILURE':
         response["status"] = "FAILED"
@@ -100,3 +185,21 @@ def get_upload_status(task_id: str):
         response["error_code"] = "UPLOAD_TASK_FAILED"
 
     return response
+
+
+@router.get("/{task_id}/report")
+def download_error_report(task_id: str):
+    try:
+        uuid.UUID(task_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid task id")
+
+    report_path = os.path.join(get_config().report_dir, f"report_{task_id}.csv")
+    if not os.path.exists(report_path):
+        raise HTTPException(status_code=404, detail="Report not found")
+
+    return FileResponse(
+        report_path,
+        media_type="text/csv",
+        filename=f"validation_report_{task_id}.csv"
+    )
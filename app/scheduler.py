@@ -0,0 +1,239 @@
+import time
+import logging
+from typing import Optional
+
+import redis
+
+from .config import get_config
+
+logger = logging.getLogger(__name__)
+
+config = get_config()
+
+PRIORITY_QUEUE = "imports.priority"
+DEFAULT_QUEUE = "imports.default"
+BULK_QUEUE = "imports.bulk"
+IMPORT_QUEUES = (PRIORITY_QUEUE, DEFAULT_QUEUE, BULK_QUEUE)
+
+PRIORITIES = {
+    "high": PRIORITY_QUEUE,
+    "normal": DEFAULT_QUEUE,
+    "low": BULK_QUEUE,
+}
+
+DEFAULT_SOURCE = "default"
+
+# Products are keyed only by SKU, so any two sources may upsert the same rows.
+# Sources not mapped in SOURCE_GROUPS share this group and import one at a time.
+DEFAULT_GROUP = "products"
+
+# A slot is held for at most this long without being refreshed, so a worker
+# that dies mid-import cannot block its group forever. Matches the broker
+# visibility timeout, after which the task is redelivered anyway.
+SLOT_LEASE_SECONDS = 3600
+
+# Waiting jobs are ordered by queue first, then by upload time.
+QUEUE_RANKS = {
+    PRIORITY_QUEUE: 0,
+    DEFAULT_QUEUE: 1,
+    BULK_QUEUE: 2,
+}
+
+# Large enough that a lower rank always sorts ahead of any enqueue timestamp.
+RANK_WEIGHT = 10 ** 10
+
+# A waiting job that has not polled for a slot within this long is dropped
+# from the head of the line so a lost task cannot stall its group. A job that
+# was only delayed takes its original place back on its next poll.
+STALE_WAITING_SECONDS = max(60, 3 * config.source_retry_delay)
+
+# Job metadata for tasks that never ran is dropped after this.
+JOB_TTL_SECONDS = 24 * 3600
+
+# Slots are granted in waiting order: a task may take a free slot only if it
+# is among the first live waiting jobs of its group.
+_ACQUIRE_SCRIPT = """
+local now = tonumber(ARGV[1])
+local limit = tonumber(ARGV[2])
+local lease = tonumber(ARGV[3])
+local task_id = ARGV[4]
+local score = ARGV[5]
+local stale_after = tonumber(ARGV[6])
+
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now - lease)
+if redis.call('ZSCORE', KEYS[1], task_id) then
+    redis.call('ZADD', KEYS[1], now, task_id)
+    return 1
+end
+
+redis.call('ZADD', KEYS[2], 'NX', score, task_id)
+redis.call('ZADD', KEYS[3], now, task_id)
+
+local stale = redis.call('ZRANGEBYSCORE', KEYS[3], '-inf', now - stale_after)
+for _, stale_id in ipairs(stale) do
+    redis.call('ZREM', KEYS[2], stale_id)
+    redis.call('ZREM', KEYS[3], stale_id)
+end
+
+local free = limit - redis.call('ZCARD', KEYS[1])
+if free <= 0 then
+    return 0
+end
+
+if redis.call('ZRANK', KEYS[2], task_id) >= free then
+    return 0
+end
+
+redis.call('ZADD', KEYS[1], now, task_id)
+redis.call('ZREM', KEYS[2], task_id)
+redis.call('ZREM', KEYS[3], task_id)
+return 1
+"""
+
+_redis: Optional[redis.Redis] = None
+
+
+def get_redis() -> redis.Redis:
+    global _redis
+    if _redis is None:
+        _redis = redis.Redis.from_url(config.redis_url, decode_responses=True)
+    return _redis
+
+
+def _slots_key(group: str) -> str:
+    return f"import:slots:{group}"
+
+
+def _waiting_key(group: str) -> str:
+    return f"import:waiting:{group}"
+
+
+def _alive_key(group: str) -> str:
+    return f"import:alive:{group}"
+
+
+def _job_key(task_id: str) -> str:
+    return f"import:job:{task_id}"
+
+
+def normalize_source(source: Optional[str]) -> str:
+    source = (source or "").strip().lower()
+    return source or DEFAULT_SOURCE
+
+
+def group_for(source: str) -> str:
+    """Returns the group of sources whose imports may write the same SKUs."""
+    return config.source_groups.get(source, DEFAULT_GROUP)
+
+
+def choose_queue(file_size: int, priority: Optional[str] = None) -> str:
+    """
+    Picks the Celery queue for an import.
+    An explicit priority wins; otherwise large files go to the bulk queue so
+    they do not hold up small, urgent updates.
+    """
+    if priority:
+        try:
+            return PRIORITIES[priority.strip().lower()]
+        except KeyError:
+            raise ValueError(
+                f"Invalid priority: {priority}. Must be one of: {', '.join(PRIORITIES)}"
+            )
+
+    if file_size >= config.large_file_threshold_mb * 1024 * 1024:
+        return BULK_QUEUE
+    return DEFAULT_QUEUE
+
+
+def _waiting_score(queue: str, enqueued_at: float) -> float:
+    return QUEUE_RANKS.get(queue, QUEUE_RANKS[DEFAULT_QUEUE]) * RANK_WEIGHT + enqueued_at
+
+
+def register_job(task_id: str, queue: str, source: str) -> None:
+    """Records a job as waiting. Must be called before the task is enqueued."""
+    now = time.time()
+    group = group_for(source)
+    score = _waiting_score(queue, now)
+    r = get_redis()
+    pipe = r.pipeline()
+    pipe.zadd(_waiting_key(group), {task_id: score})
+    pipe.zadd(_alive_key(group), {task_id: now})
+    pipe.hset(_job_key(task_id), mapping={
+        "queue": queue, "source": source, "group": group, "score": score
+    })
+    pipe.expire(_job_key(task_id), JOB_TTL_SECONDS)
+    pipe.execute()
+
+
+def unregister_job(task_id: str, source: str) -> None:
+    """Undoes register_job for a task that could not be enqueued."""
+    try:
+        group = group_for(source)
+        r = get_redis()
+        pipe = r.pipeline()
+        pipe.zrem(_waiting_key(group), task_id)
+        pipe.zrem(_alive_key(group), task_id)
+        pipe.delete(_job_key(task_id))
+        pipe.execute()
+    except redis.RedisError as e:
+        logger.warning(f"Failed to unregister import job {task_id}: {e}")
+
+
+def acquire_slot(task_id: str, source: str) -> bool:
+    r = get_redis()
+    group = group_for(source)
+    score = r.hget(_job_key(task_id), "score") or _waiting_score(DEFAULT_QUEUE, time.time())
+    acquired = r.eval(
+        _ACQUIRE_SCRIPT,
+        3,
+        _slots_key(group),
+        _waiting_key(group),
+        _alive_key(group),
+        time.time(),
+        config.group_concurrency_limit,
+        SLOT_LEASE_SECONDS,
+        task_id,
+        score,
+        STALE_WAITING_SECONDS,
+    )
+    return bool(acquired)
+
+
+def refresh_slot(task_id: str, source: str) -> None:
+    try:
+        get_redis().zadd(_slots_key(group_for(source)), {task_id: time.time()}, xx=True)
+    except redis.RedisError as e:
+        logger.warning(f"Failed to refresh import slot for {task_id}: {e}")
+
+
+def release_slot(task_id: str, source: str) -> None:
+    try:
+        r = get_redis()
+        pipe = r.pipeline()
+        pipe.zrem(_slots_key(group_for(source)), task_id)
+        pipe.delete(_job_key(task_id))
+        pipe.execute()
+    except redis.RedisError as e:
+        logger.warning(f"Failed to release import slot for {task_id}: {e}")
+
+
+def get_queue_position(task_id: str) -> Optional[dict]:
+    """
+    Returns the 1-based place of a waiting job in its group, which is the
+    order slots are granted in, or None once it is running or unknown.
+    """
+    r = get_redis()
+    job = r.hgetall(_job_key(task_id))
+    if not job:
+        return None
+
+    rank = r.zrank(_waiting_key(job["group"]), task_id)
+    if rank is None:
+        return None
+
+    return {
+        "queue": job["queue"],
+        "source": job["source"],
+        "group": job["group"],
+        "position": rank + 1,
+    }
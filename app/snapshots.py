@@ -0,0 +1,201 @@
+import hashlib
+import logging
+from typing import Optional
+
+import redis
+
+from .config import get_config
+from .scheduler import get_redis
+
+logger = logging.getLogger(__name__)
+
+config = get_config()
+
+# How long an identical upload short-circuits to the previous job. Kept in
+# line with Celery's default result expiry, after which the result is gone.
+DIGEST_TTL_SECONDS = 24 * 3600
+
+# Staged row hashes of an import that never finished are dropped after this.
+PENDING_TTL_SECONDS = 24 * 3600
+
+SNAPSHOT_MERGE_CHUNK = 10000
+
+# Products are keyed only by SKU, so one snapshot holds the last value any
+# import wrote for each SKU, whichever source it came from.
+SNAPSHOT_KEY = "import:snapshot"
+
+# Bumped whenever products change outside an import. The snapshot records the
+# generation it was built against and is ignored once the two differ.
+GENERATION_KEY = "import:generation"
+SNAPSHOT_GENERATION_KEY = "import:snapshot:generation"
+
+# Bumped by every import that writes rows. Together with the generation it
+# identifies the state of the products table, so an identical upload is only
+# skipped while nothing has written to the table since it was imported.
+WRITES_KEY = "import:writes"
+
+# Stores the digest only if the table is still in the state the import saw.
+_RECORD_SCRIPT = """
+local state = (redis.call('GET', KEYS[1]) or '0') .. ':' .. (redis.call('GET', KEYS[2]) or '0')
+if state ~= ARGV[1] then
+    return 0
+end
+redis.call('SET', KEYS[3], ARGV[2], 'EX', ARGV[3])
+return 1
+"""
+
+_binary_redis: Optional[redis.Redis] = None
+
+
+def get_binary_redis() -> redis.Redis:
+    """Client for the snapshot hashes, whose values are raw 8-byte digests."""
+    global _binary_redis
+    if _binary_redis is None:
+        _binary_redis = redis.Redis.from_url(config.redis_url)
+    return _binary_redis
+
+
+def _digest_key(source: str, state: str, digest: str) -> str:
+    return f"import:digest:{source}:{state}:{digest}"
+
+
+def _pending_key(task_id: str) -> str:
+    return f"import:snapshot:pending:{task_id}"
+
+
+def new_file_hasher():
+    return hashlib.sha256()
+
+
+def row_hash(row: dict) -> bytes:
+    """Short fingerprint of the fields an import writes for one SKU."""
+    payload = f"{row['name']}\x1f{row['description'] or ''}".encode("utf-8")
+    return hashlib.blake2b(payload, digest_size=8).digest()
+
+
+def invalidate() -> None:
+    """
+    Marks the snapshot and digest cache as stale. Call this before committing
+    any change to products made outside an import.
+    """
+    get_redis().incr(GENERATION_KEY)
+
+
+def current_generation() -> int:
+    return int(get_redis().get(GENERATION_KEY) or 0)
+
+
+def current_state() -> str:
+    generation, writes = get_redis().mget(GENERATION_KEY, WRITES_KEY)
+    return f"{generation or 0}:{writes or 0}"
+
+
+def mark_written() -> str:
+    """
+    Records that an import is about to commit row changes and returns the
+    state the table will be in if no one else writes meanwhile.
+    """
+    r = get_redis()
+    pipe = r.pipeline()
+    pipe.get(GENERATION_KEY)
+    pipe.incr(WRITES_KEY)
+    generation, writes = pipe.execute()
+    return f"{generation or 0}:{writes}"
+
+
+def snapshot_is_current(generation: int) -> bool:
+    return get_redis().get(SNAPSHOT_GENERATION_KEY) == str(generation)
+
+
+def find_previous_import(source: str, digest: str) -> Optional[str]:
+    return get_redis().get(_digest_key(source, current_state(), digest))
+
+
+def record_import(source: str, digest: str, task_id: str, state: str) -> bool:
+    """
+    Remembers a committed import of this file so an identical upload can
+    reuse its result. Skipped if another write happened since state was taken.
+    """
+    recorded = get_redis().eval(
+        _RECORD_SCRIPT,
+        3,
+        GENERATION_KEY,
+        WRITES_KEY,
+        _digest_key(source, state, digest),
+        state,
+        task_id,
+        DIGEST_TTL_SECONDS,
+    )
+    return bool(recorded)
+
+
+def filter_changed(task_id: str, batch: list, full: bool = False) -> list:
+    """
+    Returns the rows of a batch that are new or differ from what is in the
+    DB, as far as the snapshot and earlier batches of this import know.
+    Their hashes are staged and only become part of the snapshot once the
+    import commits. With full, every row is treated as changed.
+    """
+    if not batch:
+        return []
+
+    hashes = {}
+    for row in batch:
+        hashes[row["sku"]] = row_hash(row)
+
+    r = get_binary_redis()
+    if full:
+        changed_skus = set(hashes)
+    else:
+        skus = list(hashes)
+        pipe = r.pipeline()
+        pipe.hmget(_pending_key(task_id), skus)
+        pipe.hmget(SNAPSHOT_KEY, skus)
+        staged, committed = pipe.execute()
+        # A SKU written earlier in this run is compared against that value,
+        # not the snapshot, so the last occurrence in the file always wins.
+        changed_skus = {
+            sku for sku, h, s, c in zip(skus, hashes.values(), staged, committed)
+            if (s if s is not None else c) != h
+        }
+    if not changed_skus:
+        return []
+
+    pipe = r.pipeline()
+    pipe.hset(_pending_key(task_id), mapping={sku: hashes[sku] for sku in changed_skus})
+    pipe.expire(_pending_key(task_id), PENDING_TTL_SECONDS)
+    pipe.execute()
+
+    return [row for row in batch if row["sku"] in changed_skus]
+
+
+def commit_snapshot(task_id: str, generation: int, reset: bool = False) -> None:
+    """
+    Merges the staged row hashes of a committed import into the snapshot.
+    With reset, the stale snapshot is dropped first and the result is marked
+    as built against the given generation.
+    """
+    r = get_binary_redis()
+    pending = _pending_key(task_id)
+    if reset:
+        r.delete(SNAPSHOT_KEY)
+
+    chunk = {}
+    for sku, h in r.hscan_iter(pending, count=SNAPSHOT_MERGE_CHUNK):
+        chunk[sku] = h
+        if len(chunk) >= SNAPSHOT_MERGE_CHUNK:
+            r.hset(SNAPSHOT_KEY, mapping=chunk)
+            chunk = {}
+    if chunk:
+        r.hset(SNAPSHOT_KEY, mapping=chunk)
+    r.delete(pending)
+
+    if reset:
+        r.set(SNAPSHOT_GENERATION_KEY, generation)
+
+
+def discard_snapshot(task_id: str) -> None:
+    try:
+        get_binary_redis().delete(_pending_key(task_id))
+    except Exception as e:
+        logger.warning(f"Failed to discard staged snapshot for {task_id}: {e}")
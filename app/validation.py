@@ -0,0 +1,230 @@
+import csv
+from array import array
+from bisect import bisect_left
+from typing import Callable, Optional
+
+from .schemas import ProductBase
+
+REPORT_FIELDS = ["line", "field", "error", "value"]
+
+# Truncate offending values in the report so a corrupt file can't blow it up.
+MAX_REPORTED_VALUE_LENGTH = 200
+
+# SKU hashes are split into this many buckets when looking for duplicates, so
+# only one small dict is alive at a time instead of one entry per SKU.
+DUPLICATE_BUCKETS = 256
+
+# Same normalization process_csv_file applies before writing a row.
+NORMALIZERS = {
+    "sku": lambda values: [v.strip().lower() for v in values],
+    "name": lambda values: [v.strip() for v in values],
+    "description": lambda values: values,
+}
+
+
+def _field_rules() -> dict:
+    """
+    Derives required/length rules from ProductBase once, so rows can be
+    checked with plain string operations instead of building a model per row.
+    """
+    rules = {}
+    for name in ("sku", "name", "description"):
+        field = ProductBase.model_fields[name]
+        min_length = max_length = None
+        for constraint in field.metadata:
+            min_length = getattr(constraint, "min_length", min_length)
+            max_length = getattr(constraint, "max_length", max_length)
+        rules[name] = {
+            "required": field.is_required(),
+            "min_length": min_length,
+            "max_length": max_length,
+        }
+    return rules
+
+
+FIELD_RULES = _field_rules()
+
+
+def _truncate(value: str) -> str:
+    if len(value) > MAX_REPORTED_VALUE_LENGTH:
+        return value[:MAX_REPORTED_VALUE_LENGTH] + "..."
+    return value
+
+
+def _check_column(name: str, values: list, lines: list, rule: dict) -> list:
+    """Checks one column of a chunk at a time and returns its errors."""
+    lengths = list(map(len, values))
+    errors = []
+
+    if rule["required"]:
+        errors.extend(
+            (lines[i], name, "required field is empty", "")
+            for i, n in enumerate(lengths) if n == 0
+        )
+
+    min_length = rule["min_length"]
+    if min_length is not None and min_length > 1:
+        errors.extend(
+            (lines[i], name, f"shorter than {min_length} characters", _truncate(values[i]))
+            for i, n in enumerate(lengths) if 0 < n < min_length
+        )
+
+    max_length = rule["max_length"]
+    if max_length is not None:
+        errors.extend(
+            (lines[i], name, f"longer than {max_length} characters", _truncate(values[i]))
+            for i, n in enumerate(lengths) if n > max_length
+        )
+
+    return errors
+
+
+def _find_hash_repeats(hashes: array, lines: array) -> list:
+    """
+    Returns the line numbers of every SKU hash that occurs more than once,
+    grouped by hash. These are only candidates until the SKUs are compared.
+    """
+    bucket_hashes = [array("q") for _ in range(DUPLICATE_BUCKETS)]
+    bucket_lines = [array("L") for _ in range(DUPLICATE_BUCKETS)]
+    mask = DUPLICATE_BUCKETS - 1
+    for h, line in zip(hashes, lines):
+        bucket_hashes[h & mask].append(h)
+        bucket_lines[h & mask].append(line)
+
+    repeats = []
+    for b in range(DUPLICATE_BUCKETS):
+        seen = {}
+        for h, line in zip(bucket_hashes[b], bucket_lines[b]):
+            seen.setdefault(h, []).append(line)
+        repeats.extend(group for group in seen.values() if len(group) > 1)
+        bucket_hashes[b] = bucket_lines[b] = None
+
+    return repeats
+
+
+def _confirm_duplicates(file_path: str, sku_index: int, repeats: list) -> list:
+    """
+    Re-reads only the SKUs on candidate lines and returns
+    (line, first_line, sku) for real duplicates, ordered by line.
+    """
+    wanted = {line for group in repeats for line in group}
+    last_line = max(wanted)
+    skus = {}
+
+    with open(file_path, mode="r", encoding="utf-8", newline="") as f:
+        reader = csv.reader(f)
+        next(reader, None)
+        for row in reader:
+            line = reader.line_num
+            if line in wanted and sku_index < len(row):
+                skus[line] = NORMALIZERS["sku"]([row[sku_index]])[0]
+            if line >= last_line:
+                break
+
+    duplicates = []
+    for group in repeats:
+        first_seen = {}
+        for line in group:
+            sku = skus[line]
+            first_line = first_seen.setdefault(sku, line)
+            if first_line != line:
+                duplicates.append((line, first_line, sku))
+
+    duplicates.sort()
+    return duplicates
+
+
+def validate_csv(
+    file_path: str,
+    report_path: str,
+    on_progress: Optional[Callable[[int], None]] = None,
+    chunk_size: int = 10000
+) -> dict:
+    """
+    Validates a product CSV in a single streaming pass without touching the
+    database, writing one report row per problem found.
+    Rows are read in chunks and checked column by column. Duplicate SKUs are
+    tracked as 64-bit hashes; repeated hashes are confirmed against the SKUs
+    on those lines only and reported at the end of the report.
+    """
+    total_rows = 0
+    error_count = 0
+    error_lines = array("L")
+    sku_hashes = array("q")
+    sku_lines = array("L")
+
+    with open(file_path, mode="r", encoding="utf-8", newline="") as f, \
+            open(report_path, mode="w", encoding="utf-8", newline="") as out:
+        reader = csv.reader(f)
+        writer = csv.writer(out)
+        writer.writerow(REPORT_FIELDS)
+
+        header = next(reader, [])
+        index = {name: i for i, name in enumerate(header)}
+        missing_columns = [
+            name for name, rule in FIELD_RULES.items()
+            if rule["required"] and name not in index
+        ]
+        for name in missing_columns:
+            writer.writerow([1, name, "missing required column", ""])
+            error_count += 1
+
+        # Columns reported missing above are not checked again on every row.
+        checks = [
+            (name, index[name], rule) for name, rule in FIELD_RULES.items()
+            if name in index
+        ]
+
+        while True:
+            rows = []
+            lines = []
+            for row in reader:
+                # DictReader, which the import uses, skips blank lines too.
+                if not row:
+                    continue
+                rows.append(row)
+                lines.append(reader.line_num)
+                if len(rows) >= chunk_size:
+                    break
+            if not rows:
+                break
+
+            errors = []
+            for name, idx, rule in checks:
+                values = NORMALIZERS[name]([row[idx] if idx < len(row) else "" for row in rows])
+                errors.extend(_check_column(name, values, lines, rule))
+
+                if name == "sku":
+                    sku_hashes.extend(hash(v) for v in values if v)
+                    sku_lines.extend(line for v, line in zip(values, lines) if v)
+
+            if errors:
+                errors.sort(key=lambda e: e[0])
+                writer.writerows(errors)
+                error_count += len(errors)
+                error_lines.extend(sorted({e[0] for e in errors}))
+
+            total_rows += len(rows)
+            if on_progress:
+                on_progress(total_rows)
+
+        repeats = _find_hash_repeats(sku_hashes, sku_lines)
+        del sku_hashes, sku_lines
+        duplicates = _confirm_duplicates(file_path, index["sku"], repeats) if repeats else []
+
+        invalid_rows = len(error_lines)
+        for line, first_line, sku in duplicates:
+            writer.writerow([line, "sku", f"duplicate of line {first_line}", _truncate(sku)])
+            pos = bisect_left(error_lines, line)
+            if pos == len(error_lines) or error_lines[pos] != line:
+                invalid_rows += 1
+        error_count += len(duplicates)
+
+    return {
+        "total_rows": total_rows,
+        "valid_rows": total_rows - invalid_rows,
+        "invalid_rows": invalid_rows,
+        "error_count": error_count,
+        "duplicate_skus": len(duplicates),
+        "missing_columns": missing_columns,
+    }